@@ -0,0 +1,253 @@
+# vaccination-app-suite/post-vaccination/pose_tracker.py
+import cv2
+import numpy as np
+
+"""
+Keeps stable person IDs across frames by matching poses, and predicts
+key_point positions on the frames where the pose estimator is skipped.
+"""
+
+SKELETON = [
+    ('Neck', 'Right Shoulder'), ('Right Shoulder', 'Right Elbow'), ('Right Elbow', 'Right Wrist'),
+    ('Neck', 'Left Shoulder'), ('Left Shoulder', 'Left Elbow'), ('Left Elbow', 'Left Wrist'),
+    ('Neck', 'Right Hip'), ('Right Hip', 'Right Knee'), ('Right Knee', 'Right Ankle'),
+    ('Neck', 'Left Hip'), ('Left Hip', 'Left Knee'), ('Left Knee', 'Left Ankle'),
+    ('Neck', 'Nose'), ('Nose', 'Right Eye'), ('Right Eye', 'Right Ear'),
+    ('Nose', 'Left Eye'), ('Left Eye', 'Left Ear')
+]
+
+
+class KeyPoint:
+    """Key point coordinates, -1 when the point was not found.
+    """
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x=-1, y=-1):
+        self.x = x
+        self.y = y
+
+    def is_valid(self):
+        return self.x != -1 and self.y != -1
+
+
+class TrackedPose:
+    """A person's key_points and per key point velocity in pixels per frame.
+    """
+    def __init__(self, person_id):
+        self.id = person_id
+        self.key_points = {}
+        self.velocities = {}
+        self.frames_since_estimate = 0
+        self.misses = 0
+
+    def centroid(self):
+        points = [point for point in self.key_points.values() if point.is_valid()]
+        if len(points) == 0:
+            return None
+        return (sum(point.x for point in points) / len(points),
+                sum(point.y for point in points) / len(points))
+
+    def correct(self, key_points):
+        """Replaces the key_points with a fresh estimate and updates the
+        velocities from the distance moved since the last estimate.
+        """
+        frames = self.frames_since_estimate + 1 # this frame is one more since the last estimate
+        for name, measured in key_points.items():
+            point = self.key_points.get(name)
+            if point is None:
+                point = self.key_points[name] = KeyPoint()
+            if measured.x != -1 and measured.y != -1:
+                if point.is_valid() and name in self.velocities:
+                    # velocity from the last estimate, not from the predicted position
+                    start_x, start_y = self.velocities[name][2:]
+                    self.velocities[name] = [(measured.x - start_x) / frames, (measured.y - start_y) / frames,
+                                             measured.x, measured.y]
+                else:
+                    self.velocities[name] = [0.0, 0.0, measured.x, measured.y]
+            else:
+                self.velocities.pop(name, None)
+            point.x = measured.x
+            point.y = measured.y
+        self.frames_since_estimate = 0
+        self.misses = 0
+
+    def predict(self, damping):
+        """Moves each valid key point by its velocity for one frame.
+        """
+        for name, velocity in self.velocities.items():
+            point = self.key_points[name]
+            point.x += velocity[0]
+            point.y += velocity[1]
+            velocity[0] *= damping
+            velocity[1] *= damping
+        self.frames_since_estimate += 1
+
+    def box(self, margin):
+        """Returns the (start_x, start_y, end_x, end_y) around the valid
+        key_points, padded on each side by margin times the larger side.
+        """
+        points = [point for point in self.key_points.values() if point.is_valid()]
+        if len(points) == 0:
+            return None
+        start_x, end_x = min(point.x for point in points), max(point.x for point in points)
+        start_y, end_y = min(point.y for point in points), max(point.y for point in points)
+        pad = margin * max(end_x - start_x, end_y - start_y)
+        return (start_x - pad, start_y - pad, end_x + pad, end_y + pad)
+
+
+class PoseTracker:
+    """Matches poses to tracked people by the distance between key_point
+    centroids and predicts key_points between pose estimates.
+    """
+    def __init__(self, max_distance=150, max_misses=2, damping=0.8):
+        self.max_distance = max_distance # pixels, configure as needed
+        self.max_misses = max_misses # estimates a person can be missing before the ID is dropped
+        self.damping = damping # velocity kept per predicted frame
+        self.tracks = {}
+        self._next_id = 0
+
+    def update(self, poses):
+        """Matches freshly estimated poses to the tracked people.
+
+        Args:
+            poses (list): The poses from the pose estimator
+
+        Returns:
+            list: The TrackedPose of every person in the frame
+        """
+        candidates = []
+        for index, pose in enumerate(poses):
+            center = _centroid(pose.key_points)
+            if center is None:
+                continue
+            for person_id, track in self.tracks.items():
+                track_center = track.centroid()
+                if track_center is None:
+                    continue
+                distance = np.hypot(center[0] - track_center[0], center[1] - track_center[1])
+                if distance <= self.max_distance:
+                    candidates.append((distance, index, person_id))
+
+        # greedy matching, closest pairs first
+        matched_poses, matched_tracks = set(), set()
+        for distance, index, person_id in sorted(candidates):
+            if index in matched_poses or person_id in matched_tracks:
+                continue
+            self.tracks[person_id].correct(poses[index].key_points)
+            matched_poses.add(index)
+            matched_tracks.add(person_id)
+
+        for person_id in list(self.tracks):
+            if person_id not in matched_tracks:
+                track = self.tracks[person_id]
+                track.misses += 1
+                track.frames_since_estimate += 1
+                if track.misses > self.max_misses:
+                    del self.tracks[person_id]
+
+        for index, pose in enumerate(poses):
+            if index not in matched_poses:
+                track = self.tracks[self._next_id] = TrackedPose(self._next_id)
+                track.correct(pose.key_points)
+                matched_tracks.add(self._next_id)
+                self._next_id += 1
+
+        return [self.tracks[person_id] for person_id in sorted(matched_tracks)]
+
+    def predict(self):
+        """Predicts the key_points of the people seen at the last estimate.
+
+        Returns:
+            list: The TrackedPose of every person in the frame
+        """
+        tracks = []
+        for track in self.tracks.values():
+            if track.misses == 0:
+                track.predict(self.damping)
+                tracks.append(track)
+            else:
+                # not moved, but counted so the next velocity spans the gap
+                track.frames_since_estimate += 1
+        return tracks
+
+    def boxes(self, margin=0.25):
+        """Returns the padded box around each person seen at the last
+        estimate, see TrackedPose.box.
+        """
+        boxes = []
+        for track in self.tracks.values():
+            if track.misses == 0:
+                box = track.box(margin)
+                if box is not None:
+                    boxes.append(box)
+        return boxes
+
+
+class MotionDetector:
+    """Flags frames that differ from the previous one, using a small
+    grayscale copy of the frame. Changes inside the ignored boxes, such as
+    the people already being tracked, do not count.
+    """
+    def __init__(self, width=160, pixel_threshold=25, area_threshold=0.02):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.area_threshold = area_threshold # fraction of changed pixels, configure as needed
+        self._previous = None
+        self._current = None
+        self._difference = None
+
+    def update(self, frame, ignore=()):
+        """Compares frame to the previous one.
+
+        Args:
+            frame (numpy array): The current frame
+            ignore (list): (start_x, start_y, end_x, end_y) boxes in frame pixels to leave out
+
+        Returns:
+            boolean: True if enough of the frame outside the ignored boxes changed
+        """
+        scale = self.width / frame.shape[1]
+        height = max(int(frame.shape[0] * scale), 1)
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        if self._previous is None or self._previous.shape != gray.shape:
+            self._previous = gray
+            self._current = np.empty_like(gray)
+            self._difference = np.empty_like(gray)
+            return True
+
+        np.copyto(self._current, gray)
+        cv2.absdiff(self._current, self._previous, dst=self._difference)
+        for start_x, start_y, end_x, end_y in ignore:
+            self._difference[max(int(start_y * scale), 0):max(int(end_y * scale) + 1, 0),
+                             max(int(start_x * scale), 0):max(int(end_x * scale) + 1, 0)] = 0
+        changed = np.count_nonzero(self._difference > self.pixel_threshold) / self._difference.size
+        self._previous, self._current = self._current, self._previous
+        return changed > self.area_threshold
+
+
+def draw_poses(image, tracks, color=(0, 255, 255)):
+    """Draws each tracked person's skeleton and ID onto image in place.
+    """
+    for track in tracks:
+        points = track.key_points
+        for start, end in SKELETON:
+            if start in points and end in points and points[start].is_valid() and points[end].is_valid():
+                cv2.line(image, (int(points[start].x), int(points[start].y)),
+                         (int(points[end].x), int(points[end].y)), color, 2)
+        for point in points.values():
+            if point.is_valid():
+                cv2.circle(image, (int(point.x), int(point.y)), 4, color, -1)
+        center = track.centroid()
+        if center is not None:
+            cv2.putText(image, "person {}".format(track.id), (int(center[0]), int(center[1])),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1, color, 2)
+    return image
+
+
+def _centroid(key_points):
+    points = [point for point in key_points.values() if point.x != -1 and point.y != -1]
+    if len(points) == 0:
+        return None
+    return (sum(point.x for point in points) / len(points),
+            sum(point.y for point in points) / len(points))
@@ -6,7 +6,9 @@ import sys
 import os
 import requests
 
-import edgeiq
+import numpy as np
+from inference import load_backend
+from pose_tracker import MotionDetector, PoseTracker, draw_poses
 
 def send_data(url, route, json):
     try:
@@ -31,20 +33,40 @@ class CheckPosture:
         self.interval = 3 # the time between the raised hand and the potential alert
         self.timestamp = None # marks when the raised hand was triggered
         self.listening = False
-        self.signals = []
+        self.signal_count = 0 # checks since the last stop, kept as counts so memory stays flat
+        self.positive_count = 0
         self.people_count = 0
         self.previous_people_count = 0
+        self.id = "post_vaccination"
         self._server_url = "http://localhost:5001/" # configure as needed
         self._start_time = time.time()
 
-        self.pose_estimator = edgeiq.PoseEstimation("alwaysai/human_pose")
+        # inference backend: "edgeiq" or "fake", configure as needed
+        # (onnxruntime has no pose support and falls back to edgeiq)
+        self.backend = os.environ.get("INFERENCE_BACKEND", "edgeiq")
+        self.backend_options = { # options per backend and model, configure as needed
+            "edgeiq": {
+                "alwaysai/human_pose": {"engine": "DNN"}
+            },
+            "fake": {
+                "alwaysai/human_pose": {"people": 3}
+            }
+        }
+        self.pose_estimator = load_backend("alwaysai/human_pose", "pose", self.backend, self.backend_options)
 
-        self.pose_estimator.load(
-            engine=edgeiq.Engine.DNN)
-
-        print("Loaded model:\n{}\n".format(self.pose_estimator.model_id))
-        print("Engine: {}".format(self.pose_estimator.engine))
-        print("Accelerator: {}\n".format(self.pose_estimator.accelerator))
+        # run the pose estimator every pose_interval frames, or sooner on motion,
+        # and track key_points on the frames in between
+        self.pose_interval = 5 # configure as needed, 1 estimates every frame
+        self.estimate_on_motion = True # configure as needed
+        self.min_pose_interval = 2 # frames, limits how often motion can trigger the estimator
+        self.motion_margin = 0.25 # motion this close to a tracked person is left to the tracker
+        self.pose_tracker = PoseTracker()
+        self.motion_detector = MotionDetector()
+        self.frame_count = 0
+        self.pose_calls = 0
+        self.inference_time = 0
+        self._frames_since_pose = None
+        self._frame = None # reused for markup
 
     def is_listening(self):
         return self.listening
@@ -57,7 +79,8 @@ class CheckPosture:
     def stop_listening(self):
         self.timestamp = None
         self.listening = False
-        self.signals = []
+        self.signal_count = 0
+        self.positive_count = 0
         print("stopping listening until recieve start signal")
     
     def has_expired(self):
@@ -159,13 +182,13 @@ class CheckPosture:
             True if all posture functions return True; False otherwise
         """
         hand_raised = self.check_raised_hand()
-        self.signals.append(hand_raised)
+        self.signal_count += 1
+        if hand_raised:
+            self.positive_count += 1
         if self.is_listening():
             if self.has_expired():
-                signals = [i for i in self.signals if i]
-
                 # check if the number of positives each round against the number of people observed
-                signal = True if len(signals) >= len(self.signals)/self.get_people_count() else False 
+                signal = True if self.positive_count >= self.signal_count/self.get_people_count() else False 
                 self.stop_listening()
                 return 1 if signal else 0
         elif hand_raised:
@@ -178,38 +201,71 @@ class CheckPosture:
 
     def send_events(self, hand_count, people_count):
         event_log = {}
+        event_log['device_id'] = self.id
         event_log['time_marker'] = str(round((time.time() - self._start_time), 2))
         event_log['hands_raised'] = hand_count
         event_log['post_vaccine_count'] = people_count
+        event_log['inference_latency'] = {self.pose_estimator.model_id: self.pose_estimator.latency.summary()}
         print("event_log: {}".format(json.dumps(event_log)))
         
         # send alert to server
         send_data(self._server_url, "event", event_log)
 
+    def should_estimate(self, frame):
+        """Decides whether to run the pose estimator on this frame.
+
+        Args:
+            frame (numpy array): The current frame
+
+        Returns:
+            boolean: True if the pose estimator should run
+        """
+        # only motion the tracked people do not explain, e.g. someone new, counts
+        motion = self.estimate_on_motion and \
+            self.motion_detector.update(frame, self.pose_tracker.boxes(self.motion_margin))
+        if self._frames_since_pose is None:
+            return True
+        frames = self._frames_since_pose + 1
+        return frames >= self.pose_interval or (motion and frames >= self.min_pose_interval)
+
     def update(self, frame):
-        results = self.pose_estimator.estimate(frame)
+        self.frame_count += 1
+        if self.should_estimate(frame):
+            results = self.pose_estimator.estimate(frame)
+            tracks = self.pose_tracker.update(results.poses)
+            self.inference_time = results.duration
+            self.pose_calls += 1
+            self._frames_since_pose = 0
+        else:
+            tracks = self.pose_tracker.predict()
+            self._frames_since_pose += 1
         
         # Generate text to display on streamer
         text = ["Model: {}".format(self.pose_estimator.model_id)]
         text.append(
-                "Inference time: {:1.3f} s".format(results.duration))
+                "Inference time: {:1.3f} s".format(self.inference_time))
+        text.append("Pose estimates: {} of {} frames".format(self.pose_calls, self.frame_count))
+        text.append(self.pose_estimator.latency_text())
 
         hand_count = 0
-        self.set_people_count(len(results.poses))
+        self.set_people_count(len(tracks))
 
-        for ind, pose in enumerate(results.poses):
+        for track in tracks:
 
             # update the instance key_points to check the posture
-            self.set_key_points(pose.key_points)
+            self.set_key_points(track.key_points)
             value = self.check_for_hand_raised()
             if value != -1:
                 if value == 1:
                     hand_count += 1
-                    print("person {} raising hand".format(ind))
-                self.send_events(value, len(results.poses))
+                    print("person {} raising hand".format(track.id))
+                self.send_events(value, len(tracks))
 
-        frame = results.draw_poses(frame)
-        text.append("{} people in total".format(len(results.poses)))
+        if self._frame is None or self._frame.shape != frame.shape:
+            self._frame = np.empty_like(frame)
+        np.copyto(self._frame, frame)
+        frame = draw_poses(self._frame, tracks)
+        text.append("{} people in total".format(len(tracks)))
         text.append("{} people hands raised".format(hand_count))
 
-        return frame, text
\ No newline at end of file
+        return frame, text
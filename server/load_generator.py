@@ -0,0 +1,171 @@
+# vaccination-app-suite/server/load_generator.py
+"""
+Simulates many waiting room, vaccination and post-vaccination devices
+posting events to the aggregation server, and reports the ingestion
+throughput and request latency.
+
+Starts its own server in the same process unless --url is given.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+from server import Aggregator, EventServer
+
+KINDS = ["waiting_room", "vaccination_area", "post_vaccination"]
+
+
+class SimulatedDevice:
+    """Produces the same event payloads as one of the apps.
+    """
+    def __init__(self, index, seed=0):
+        self.kind = KINDS[index % len(KINDS)]
+        self.device_id = "{}_{}".format(self.kind, index)
+        self.random = random.Random(seed + index)
+        self.total_vaccinations = 0
+        self._start_time = time.time()
+
+    def setup(self):
+        return {'device_id': self.device_id, 'area': 4, 'chairs': {}}
+
+    def event(self):
+        event_log = {'device_id': self.device_id,
+                     'time_marker': str(round(time.time() - self._start_time, 2))}
+        if self.kind == "waiting_room":
+            people = self.random.randint(0, 8)
+            masks = self.random.randint(0, people)
+            event_log['in_area'] = list(range(people))
+            event_log['covid_data'] = {
+                'masks': masks,
+                'no_masks': people - masks,
+                'uncertain_masks': 0,
+                'ave_distance': self.random.uniform(20, 120)
+            }
+        elif self.kind == "vaccination_area":
+            new = 1 if self.random.random() < 0.2 else 0
+            self.total_vaccinations += new
+            event_log['vaccination_data'] = {
+                'new_vaccinations': new,
+                'total_vaccinations': self.total_vaccinations
+            }
+        else:
+            event_log['hands_raised'] = 1 if self.random.random() < 0.05 else 0
+            event_log['post_vaccine_count'] = self.random.randint(0, 6)
+        return event_log
+
+
+class Connection:
+    """A keep-alive HTTP/1.1 connection that posts JSON.
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def post(self, path, payload):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode()
+        head = "POST {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n".format(
+            path, self.host, len(body))
+        self.writer.write(head.encode('latin-1') + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        await self.reader.readexactly(length)
+        return status
+
+    async def get(self, path):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        writer.write("GET {} HTTP/1.1\r\nHost: {}\r\nConnection: close\r\n\r\n".format(path, self.host).encode('latin-1'))
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+async def run_device(device, host, port, interval, batch, deadline, latencies, errors):
+    connection = Connection(host, port)
+    try:
+        await connection.post("/setup", device.setup())
+
+        # spread the devices out so they do not all post at the same moment
+        await asyncio.sleep(device.random.uniform(0, interval))
+        while time.time() < deadline:
+            started = time.perf_counter()
+            if batch > 1:
+                status = await connection.post("/events", [device.event() for _ in range(batch)])
+            else:
+                status = await connection.post("/event", device.event())
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors.append(status)
+            await asyncio.sleep(interval)
+    except (ConnectionError, asyncio.IncompleteReadError) as e:
+        errors.append(str(e))
+    finally:
+        connection.close()
+
+
+async def run(args):
+    server = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        server = EventServer(Aggregator(), "127.0.0.1", 0)
+        await server.start()
+        host, port = "127.0.0.1", server.port
+
+    latencies, errors = [], []
+    devices = [SimulatedDevice(index, args.seed) for index in range(args.devices)]
+    started = time.time()
+    await asyncio.gather(*[
+        run_device(device, host, port, args.interval, args.batch, started + args.duration, latencies, errors)
+        for device in devices])
+    elapsed = time.time() - started
+
+    latencies.sort()
+    requests_sent = len(latencies)
+    print("devices: {}".format(args.devices))
+    print("requests: {} ({:.1f}/s)".format(requests_sent, requests_sent / elapsed))
+    print("events: {} ({:.1f}/s)".format(requests_sent * args.batch, requests_sent * args.batch / elapsed))
+    if requests_sent > 0:
+        print("latency p50: {:.2f} ms".format(1000 * latencies[requests_sent // 2]))
+        print("latency p99: {:.2f} ms".format(1000 * latencies[min(int(requests_sent * 0.99), requests_sent - 1)]))
+    print("errors: {}".format(len(errors)))
+    print("rollup: {}".format(json.dumps(await Connection(host, port).get("/rollup"), indent=4)))
+
+    if server is not None:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulates many devices posting events.")
+    parser.add_argument("--url", help="server to load, e.g. http://localhost:5001/ (default: start one in process)")
+    parser.add_argument("--devices", type=int, default=300)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--interval", type=float, default=0.1, help="seconds between posts per device")
+    parser.add_argument("--batch", type=int, default=1, help="events per post, above 1 uses /events")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
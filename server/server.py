@@ -0,0 +1,390 @@
+# vaccination-app-suite/server/server.py
+"""
+Local stand-in for the event endpoint the apps post to. Accepts `setup`
+and `event` payloads from many devices at once, keeps the latest events of
+each device in a fixed-size ring buffer and answers rollup queries.
+
+Routes:
+    POST /setup          a device setup payload
+    POST /event          a single event, or a JSON list of events
+    POST /events         a JSON list of events (batched ingestion)
+    POST /devices/<id>/full-distances
+                         ask a waiting room device for one full pair distance
+                         dump, sent as send_full_distances in its next event reply
+    GET  /rollup         totals across all devices, see Aggregator.rollup
+    GET  /devices        per-device summary
+    GET  /devices/<id>   the buffered events of one device, ?limit=n
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from urllib.parse import parse_qs, urlsplit
+
+HISTORY = 512 # events kept per device, configure as needed
+MAX_BODY = 8 * 1024 * 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+# fields the rollup reads, and the types they must have when present;
+# every int field is a count and must not be negative
+EVENT_FIELDS = {
+    'device_id': str,
+    'in_area': list,
+    'post_vaccine_count': int,
+    'hands_raised': int,
+    'covid_data': dict,
+    'vaccination_data': dict
+}
+COVID_FIELDS = {'masks': int, 'no_masks': int, 'uncertain_masks': int}
+VACCINATION_FIELDS = {'total_vaccinations': int}
+
+
+def check_fields(payload, fields, prefix=""):
+    """Returns an error message if a field in payload has the wrong type or
+    is a negative count, otherwise None.
+    """
+    if not isinstance(payload, dict):
+        return "{} must be an object".format(prefix or "payload")
+    for name, expected in fields.items():
+        value = payload.get(name)
+        if value is None:
+            continue
+        # bool is an int subclass, but never a valid count
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            return "{}{} must be {}".format(prefix, name, expected.__name__)
+        if expected is int and value < 0:
+            return "{}{} must not be negative".format(prefix, name)
+    return None
+
+
+def validate_event(event):
+    error = check_fields(event, EVENT_FIELDS)
+    if error is None and event.get('covid_data') is not None:
+        error = check_fields(event['covid_data'], COVID_FIELDS, "covid_data.")
+    if error is None and event.get('vaccination_data') is not None:
+        error = check_fields(event['vaccination_data'], VACCINATION_FIELDS, "vaccination_data.")
+    return error
+
+
+def mask_counts(event):
+    covid_data = event.get('covid_data') or {}
+    return (covid_data.get('masks') or 0, covid_data.get('no_masks') or 0, covid_data.get('uncertain_masks') or 0)
+
+
+class DeviceState:
+    """Setup, running totals and recent events of one device.
+
+    Mask compliance covers only the buffered events, so it reflects the
+    last `history` events of the device. Hands raised is a lifetime total.
+    """
+    def __init__(self, device_id, history):
+        self.device_id = device_id
+        self.setup = None
+        self.events = deque(maxlen=history) # (time received, event)
+        self.event_count = 0
+        self.last_seen = None
+
+        # latest values used by the rollup, updated on ingestion
+        self.occupancy = None
+        self.occupancy_time = None
+        self.total_vaccinations = None
+        self.hands_raised = 0
+
+        # mask counts of the buffered events, updated as events enter and leave the buffer
+        self.masks = 0
+        self.no_masks = 0
+        self.uncertain_masks = 0
+
+    def add_event(self, event, now):
+        if len(self.events) == self.events.maxlen:
+            masks, no_masks, uncertain = mask_counts(self.events[0][1])
+            self.masks -= masks
+            self.no_masks -= no_masks
+            self.uncertain_masks -= uncertain
+        self.events.append((now, event))
+        self.event_count += 1
+        self.last_seen = now
+
+        if event.get('in_area') is not None:
+            self.occupancy = len(event['in_area'])
+            self.occupancy_time = now
+        if event.get('post_vaccine_count') is not None:
+            self.occupancy = event['post_vaccine_count']
+            self.occupancy_time = now
+        if event.get('hands_raised') == 1:
+            self.hands_raised += 1
+
+        masks, no_masks, uncertain = mask_counts(event)
+        self.masks += masks
+        self.no_masks += no_masks
+        self.uncertain_masks += uncertain
+
+        vaccination_data = event.get('vaccination_data')
+        if vaccination_data and vaccination_data.get('total_vaccinations') is not None:
+            self.total_vaccinations = vaccination_data['total_vaccinations']
+
+    def buffered_seconds(self, now):
+        if len(self.events) == 0:
+            return 0
+        return now - self.events[0][0]
+
+    def occupancy_age(self, now):
+        if self.occupancy_time is None:
+            return None
+        return now - self.occupancy_time
+
+    def summary(self):
+        now = time.time()
+        return {
+            'device_id': self.device_id,
+            'setup': self.setup,
+            'event_count': self.event_count,
+            'buffered_events': len(self.events),
+            'buffered_seconds': round(self.buffered_seconds(now), 2),
+            'last_seen': self.last_seen,
+            'occupancy': self.occupancy,
+            'occupancy_age': _round(self.occupancy_age(now)),
+            'total_vaccinations': self.total_vaccinations,
+            'hands_raised_total': self.hands_raised,
+            'mask_compliance': compliance(self.masks, self.no_masks, self.uncertain_masks)
+        }
+
+
+class Aggregator:
+    """Keeps the state of every device that has sent a payload.
+    """
+    def __init__(self, history=HISTORY):
+        self.history = history
+        self.devices = {}
+        self.event_count = 0
+        self.full_distance_requests = set() # device ids to ask for a full distance dump
+        self._start_time = time.time()
+
+    def get_device(self, device_id):
+        device = self.devices.get(device_id)
+        if device is None:
+            device = self.devices[device_id] = DeviceState(device_id, self.history)
+        return device
+
+    def ingest_setup(self, setup, fallback_id):
+        device = self.get_device(setup.get('device_id') or fallback_id)
+        device.setup = setup
+        device.last_seen = time.time()
+
+    def ingest_events(self, events, fallback_id):
+        """Applies a batch of events that have already passed validate_event.
+        """
+        now = time.time()
+        for event in events:
+            self.get_device(event.get('device_id') or fallback_id).add_event(event, now)
+        self.event_count += len(events)
+        return len(events)
+
+    def request_full_distances(self, device_id):
+        self.full_distance_requests.add(device_id)
+
+    def take_full_distance_requests(self, device_ids):
+        """Returns True and clears the request if any of device_ids has a
+        pending full distance request.
+        """
+        requested = self.full_distance_requests.intersection(device_ids)
+        self.full_distance_requests.difference_update(requested)
+        return len(requested) > 0
+
+    def rollup(self):
+        """Totals across devices. Occupancy is the sum of each device's latest
+        value, with the age of the oldest one. Mask compliance covers the
+        buffered events of every device. Hands raised is a lifetime total.
+        """
+        now = time.time()
+        devices = self.devices.values()
+        ages = [device.occupancy_age(now) for device in devices if device.occupancy_time is not None]
+        elapsed = max(now - self._start_time, 1e-6)
+        return {
+            'devices': len(self.devices),
+            'events_received': self.event_count,
+            'events_per_second': round(self.event_count / elapsed, 2),
+            'total_vaccinations': sum(device.total_vaccinations or 0 for device in devices),
+            'current_occupancy': sum(device.occupancy or 0 for device in devices),
+            'oldest_occupancy_age': _round(max(ages)) if ages else None,
+            'hands_raised_total': sum(device.hands_raised for device in devices),
+            'mask_compliance': compliance(sum(device.masks for device in devices),
+                                          sum(device.no_masks for device in devices),
+                                          sum(device.uncertain_masks for device in devices)),
+            'mask_compliance_window': "last {} events per device".format(self.history)
+        }
+
+
+def compliance(masks, no_masks, uncertain):
+    total = masks + no_masks + uncertain
+    if total == 0:
+        return None
+    return round(masks / total, 4)
+
+
+def _round(value, digits=2):
+    if value is None:
+        return None
+    return round(value, digits)
+
+
+class EventServer:
+    """Minimal HTTP/1.1 server with keep-alive, so a single connection can
+    post many events.
+    """
+    def __init__(self, aggregator=None, host="0.0.0.0", port=5001):
+        self.aggregator = aggregator or Aggregator()
+        self.host = host
+        self.port = port
+        self._server = None
+        self._connections = set() # (writer, handler task) of open connections
+
+    async def start(self):
+        self._server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print("[INFO] listening on http://{}:{}/".format(self.host, self.port))
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+
+            # end idle keep-alive connections so their handlers see EOF and finish
+            for writer, _ in list(self._connections):
+                writer.close()
+            tasks = [task for _, task in self._connections]
+            if tasks:
+                await asyncio.wait(tasks, timeout=5)
+            await self._server.wait_closed()
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        fallback_id = peer[0] if peer else "unknown"
+        connection = (writer, asyncio.current_task())
+        self._connections.add(connection)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    await self.respond(writer, 400, {'error': 'malformed request line'}, keep_alive=False)
+                    break
+                method, target, version = parts
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = headers.get('content-length', '0')
+                if not length.isdigit():
+                    await self.respond(writer, 400, {'error': 'invalid content-length'}, keep_alive=False)
+                    break
+                length = int(length)
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {'error': 'body too large'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                try:
+                    status, payload = self.route(method, target, body, headers.get('x-device-id', fallback_id))
+                except Exception as e:
+                    print("[ERROR] {} {}: {}".format(method, target, e))
+                    status, payload = 500, {'error': 'internal error'}
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == "HTTP/1.1"
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    def route(self, method, target, body, fallback_id):
+        url = urlsplit(target)
+        path = url.path.rstrip('/') or '/'
+
+        if method == "POST":
+            try:
+                payload = json.loads(body or b"null")
+            except ValueError:
+                return 400, {'error': 'invalid json'}
+            if path == "/setup":
+                error = check_fields(payload, {'device_id': str})
+                if error is not None:
+                    return 400, {'error': error}
+                self.aggregator.ingest_setup(payload, fallback_id)
+                return 200, {'status': 'ok'}
+            if path in ("/event", "/events"):
+                # validate the whole batch first, so a bad event applies nothing
+                events = payload if isinstance(payload, list) else [payload]
+                for index, event in enumerate(events):
+                    error = validate_event(event)
+                    if error is not None:
+                        return 400, {'error': "event {}: {}".format(index, error)}
+                reply = {'accepted': self.aggregator.ingest_events(events, fallback_id)}
+                if self.aggregator.take_full_distance_requests(
+                        set(event.get('device_id') or fallback_id for event in events)):
+                    reply['send_full_distances'] = True
+                return 200, reply
+            if path.startswith("/devices/") and path.endswith("/full-distances"):
+                self.aggregator.request_full_distances(path[len("/devices/"):-len("/full-distances")])
+                return 200, {'status': 'requested'}
+            return 404, {'error': 'unknown route'}
+
+        if method == "GET":
+            if path == "/rollup":
+                return 200, self.aggregator.rollup()
+            if path == "/devices":
+                return 200, [device.summary() for device in self.aggregator.devices.values()]
+            if path.startswith("/devices/"):
+                device = self.aggregator.devices.get(path[len("/devices/"):])
+                if device is None:
+                    return 404, {'error': 'unknown device'}
+                try:
+                    limit = int(parse_qs(url.query).get('limit', [len(device.events)])[0])
+                except ValueError:
+                    return 400, {'error': 'limit must be an integer'}
+                events = list(device.events)[-limit:] if limit > 0 else []
+                return 200, [{'received': received, 'event': event} for received, event in events]
+            return 404, {'error': 'unknown route'}
+
+        return 405, {'error': 'method not allowed'}
+
+    async def respond(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload).encode()
+        head = "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n".format(
+            status, REASONS.get(status, ""), len(body), "keep-alive" if keep_alive else "close")
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregates events from the vaccination center apps.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--history", type=int, default=HISTORY, help="events kept per device")
+    args = parser.parse_args()
+
+    server = EventServer(Aggregator(args.history), args.host, args.port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("Program Ending")
+
+
+if __name__ == "__main__":
+    main()
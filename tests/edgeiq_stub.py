@@ -0,0 +1,97 @@
+"""
+Minimal stand-in for the parts of edgeiq the apps use, so their per-frame
+code can run in tests with the fake inference backend. Only installed when
+the real edgeiq is not available.
+"""
+import sys
+import types
+from math import hypot
+
+
+class BoundingBox:
+    def __init__(self, start_x, start_y, end_x, end_y):
+        self.start_x = start_x
+        self.start_y = start_y
+        self.end_x = end_x
+        self.end_y = end_y
+
+    @property
+    def width(self):
+        return self.end_x - self.start_x
+
+    @property
+    def height(self):
+        return self.end_y - self.start_y
+
+    @property
+    def area(self):
+        return self.width * self.height
+
+    @property
+    def center(self):
+        return ((self.start_x + self.end_x) / 2, (self.start_y + self.end_y) / 2)
+
+    def compute_distance(self, other):
+        return hypot(self.center[0] - other.center[0], self.center[1] - other.center[1])
+
+    def compute_overlap(self, other):
+        width = max(0, min(self.end_x, other.end_x) - max(self.start_x, other.start_x))
+        height = max(0, min(self.end_y, other.end_y) - max(self.start_y, other.start_y))
+        return width * height / self.area if self.area > 0 else 0
+
+
+class ObjectDetectionPrediction:
+    def __init__(self, box, confidence, label, index):
+        self.box = box
+        self.confidence = confidence
+        self.label = label
+        self.index = index
+
+
+class CentroidTracker:
+    """Keeps IDs by nearest centroid, without the real tracker's deregistering.
+    """
+    def __init__(self, deregister_frames=4, max_distance=130):
+        self.max_distance = max_distance
+        self.objects = {}
+        self._next_id = 0
+
+    def update(self, predictions):
+        tracked = {}
+        for prediction in predictions:
+            best = None
+            for object_id, previous in self.objects.items():
+                distance = prediction.box.compute_distance(previous.box)
+                if object_id not in tracked and distance <= self.max_distance and \
+                        (best is None or distance < best[0]):
+                    best = (distance, object_id)
+            if best is None:
+                best = (0, self._next_id)
+                self._next_id += 1
+            tracked[best[1]] = prediction
+        self.objects = tracked
+        return tracked
+
+
+def filter_predictions_by_label(predictions, labels):
+    return [prediction for prediction in predictions if prediction.label in labels]
+
+
+def cutout_image(image, box):
+    return image[max(int(box.start_y), 0):int(box.end_y), max(int(box.start_x), 0):int(box.end_x)]
+
+
+def install():
+    try:
+        import edgeiq
+        return edgeiq
+    except ImportError:
+        pass
+    module = types.ModuleType('edgeiq')
+    module.BoundingBox = BoundingBox
+    module.ObjectDetectionPrediction = ObjectDetectionPrediction
+    module.CentroidTracker = CentroidTracker
+    module.filter_predictions_by_label = filter_predictions_by_label
+    module.cutout_image = cutout_image
+    sys.modules['edgeiq'] = module
+    return module
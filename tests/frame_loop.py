@@ -0,0 +1,79 @@
+"""
+Helpers for driving an app's per-frame update in tests: a fake clock for
+reproducible runs and tracemalloc measurements of what each frame allocates.
+"""
+import contextlib
+import os
+import tracemalloc
+
+
+class FakeClock:
+    """Stands in for time.time and time.monotonic, advancing only on tick().
+    """
+    def __init__(self, start=1000.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def tick(self, seconds):
+        self.now += seconds
+
+
+@contextlib.contextmanager
+def quiet():
+    """Discards what the apps print on every frame.
+    """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def run_frames(update, image, frames, clock=None, fps=15):
+    """Calls update(image) for each frame, advancing clock by one frame
+    first when given.
+    """
+    for _ in range(frames):
+        if clock is not None:
+            clock.tick(1 / fps)
+        update(image)
+
+
+def _traced(snapshot):
+    return snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+
+def measure_allocations(update, image, warmup, blocks, block_frames, clock=None):
+    """Runs warmup frames, then blocks of block_frames frames while tracing.
+
+    Returns:
+        tuple: (bytes, blocks) retained by each block from snapshot diffs,
+            and the largest peak a single frame allocated above what was
+            already traced
+    """
+    growth = []
+    peak = 0
+    tracemalloc.start()
+    try:
+        with quiet():
+            # fill the reused buffers, pools and bounded histories first
+            run_frames(update, image, warmup, clock)
+            previous = _traced(tracemalloc.take_snapshot())
+            for _ in range(blocks):
+                for _ in range(block_frames):
+                    current = tracemalloc.get_traced_memory()[0]
+                    tracemalloc.reset_peak()
+                    run_frames(update, image, 1, clock)
+                    peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+                snapshot = _traced(tracemalloc.take_snapshot())
+                stats = snapshot.compare_to(previous, "lineno")
+                growth.append((sum(stat.size_diff for stat in stats), sum(stat.count_diff for stat in stats)))
+                previous = snapshot
+    finally:
+        tracemalloc.stop()
+    return growth, peak
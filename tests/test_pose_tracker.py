@@ -0,0 +1,152 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("requests")
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "post-vaccination"))
+
+import edgeiq_stub
+
+edgeiq_stub.install()
+
+import posture
+from frame_loop import FakeClock, quiet, run_frames
+from inference import FakeKeyPoint, FakePose
+from pose_tracker import MotionDetector, PoseTracker
+
+
+def pose(x, y):
+    return FakePose({'Neck': FakeKeyPoint(x, y), 'Left Shoulder': FakeKeyPoint(x + 30, y + 10),
+                     'Right Shoulder': FakeKeyPoint(x - 30, y + 10)})
+
+
+def run_scene(tracker, people, frames, interval):
+    """Estimates people(frame) every interval frames and predicts between.
+
+    Returns:
+        list: The {id: Neck (x, y)} of the tracks on every frame
+    """
+    seen = []
+    for frame in range(frames):
+        if frame % interval == 0:
+            tracks = tracker.update(people(frame))
+        else:
+            tracks = tracker.predict()
+        seen.append({track.id: (track.key_points['Neck'].x, track.key_points['Neck'].y) for track in tracks})
+    return seen
+
+
+def test_constant_velocity_is_predicted():
+    tracker = PoseTracker(damping=1.0)
+    seen = run_scene(tracker, lambda frame: [pose(100 + 4 * frame, 200 - 2 * frame)], 21, 5)
+    assert tracker.tracks[0].velocities['Neck'][:2] == [4.0, -2.0]
+    # from the second estimate on, the predicted frames are where the person is
+    for frame in range(6, 21):
+        assert seen[frame][0] == pytest.approx((100 + 4 * frame, 200 - 2 * frame))
+
+
+def test_ids_are_stable_across_skipped_frames():
+    tracker = PoseTracker()
+    # the two people pass each other around frame 66
+    people = lambda frame: [pose(100 + 6 * frame, 300), pose(900 - 6 * frame, 420)]
+    seen = run_scene(tracker, people, 100, 5)
+    assert all(sorted(tracks) == [0, 1] for tracks in seen)
+    # damped predictions trail by less than the distance between estimates
+    for frame, tracks in enumerate(seen):
+        assert tracks[0][0] == pytest.approx(100 + 6 * frame, abs=30)
+        assert tracks[1][0] == pytest.approx(900 - 6 * frame, abs=30)
+
+
+def test_missed_people_keep_their_id_until_dropped():
+    tracker = PoseTracker(max_misses=2, damping=1.0)
+    assert [track.id for track in tracker.update([pose(100, 100), pose(600, 100)])] == [0, 1]
+    assert [track.id for track in tracker.predict()] == [0, 1]
+
+    # person 1 is missed: kept, but not reported or moved until seen again
+    assert [track.id for track in tracker.update([pose(110, 100)])] == [0]
+    assert [track.id for track in tracker.predict()] == [0]
+    assert [track.id for track in tracker.update([pose(120, 100), pose(640, 100)])] == [0, 1]
+    # the velocity spans the four frames since person 1 was last estimated
+    assert tracker.tracks[1].velocities['Neck'][:2] == [10.0, 0.0]
+
+    # missed more than max_misses times: dropped, and a new ID when seen again
+    for _ in range(3):
+        tracker.update([pose(120, 100)])
+    assert sorted(tracker.tracks) == [0]
+    assert [track.id for track in tracker.update([pose(120, 100), pose(640, 100)])] == [0, 2]
+
+
+def test_motion_of_tracked_people_is_ignored():
+    detector = MotionDetector()
+    frame = np.full((480, 640, 3), 40, dtype=np.uint8)
+    moved = frame.copy()
+    cv2.rectangle(frame, (100, 100), (200, 300), (220, 220, 220), -1)
+    cv2.rectangle(moved, (140, 100), (240, 300), (220, 220, 220), -1)
+    detector.update(frame)
+    assert detector.update(moved)
+    assert not detector.update(frame, [(90, 90, 250, 310)])
+    # someone new outside the tracked boxes still counts
+    cv2.rectangle(moved, (400, 100), (500, 300), (220, 220, 220), -1)
+    assert detector.update(moved, [(90, 90, 250, 310)])
+
+
+def make_checker(monkeypatch, clock, pose_interval):
+    monkeypatch.setenv("INFERENCE_BACKEND", "fake")
+    monkeypatch.setattr(posture, "time", clock)
+    monkeypatch.setattr(posture, "send_data", lambda url, route, json: None)
+    with quiet():
+        checker = posture.CheckPosture()
+        checker.backend_options["fake"]["alwaysai/human_pose"].update(clock=clock)
+        checker.pose_estimator = posture.load_backend(
+            "alwaysai/human_pose", "pose", checker.backend, checker.backend_options)
+    checker.pose_interval = pose_interval
+    return checker
+
+
+def test_pose_interval_keeps_the_alerts(monkeypatch):
+    alerts = {}
+    for pose_interval in [1, 5]:
+        clock = FakeClock()
+        checker = make_checker(monkeypatch, clock, pose_interval)
+        sent = []
+        checker.send_events = lambda hand_count, people_count: sent.append(hand_count)
+        image = np.zeros((1080, 1920, 3), dtype=np.uint8)
+        with quiet():
+            run_frames(checker.update, image, 1800, clock)
+        alerts[pose_interval] = (sent.count(1), checker.pose_calls)
+
+    assert alerts[1][0] > 0
+    assert alerts[5][0] == alerts[1][0], alerts
+    assert alerts[1][1] == 1800
+    assert alerts[5][1] == 360
+
+
+def test_tracked_motion_does_not_force_estimates(monkeypatch):
+    # four scene frames per app frame, so the people move 12-20 px a frame
+    # and ungated motion would estimate every min_pose_interval frames
+    def render(checker, clock, frames, gate):
+        image = np.empty((480, 640, 3), dtype=np.uint8)
+        scene = checker.pose_estimator
+        if not gate:
+            checker.pose_tracker.boxes = lambda margin: []
+        with quiet():
+            for _ in range(frames):
+                clock.tick(4 / 15)
+                image[:] = 40
+                for index, x, y in scene._positions(image, scene.scene_frame()):
+                    cv2.rectangle(image, (x + 15, y + 15), (x + 105, y + 150), (220, 220, 220), -1)
+                checker.update(image)
+        return checker.pose_calls
+
+    calls = {}
+    for gate in [False, True]:
+        clock = FakeClock()
+        calls[gate] = render(make_checker(monkeypatch, clock, 5), clock, 300, gate)
+    assert calls[False] == 150
+    assert calls[True] <= 70, calls
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("requests")
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "post-vaccination"))
+
+import edgeiq_stub
+
+edgeiq_stub.install()
+
+import posture
+from frame_loop import FakeClock, measure_allocations, quiet
+
+WARMUP_FRAMES = 1600 # fills the 300 call latency history at pose_interval 5
+BLOCK_FRAMES = 300
+BLOCKS = 5
+MAX_GROWTH = 8 * 1024 # bytes kept after the first block, the old signals list kept ~28 KiB
+MAX_FRAME_PEAK = 1024 * 1024 # bytes a frame may allocate on top, a frame copy is ~6 MiB
+
+
+@pytest.mark.parametrize("raise_hands", [False, True])
+def test_update_allocations_stay_flat(monkeypatch, raise_hands):
+    clock = FakeClock()
+    monkeypatch.setenv("INFERENCE_BACKEND", "fake")
+    monkeypatch.setattr(posture, "time", clock)
+    monkeypatch.setattr(posture, "send_data", lambda url, route, json: None)
+    with quiet():
+        checker = posture.CheckPosture()
+        checker.backend_options["fake"]["alwaysai/human_pose"].update(clock=clock, raise_hands=raise_hands)
+        checker.pose_estimator = posture.load_backend(
+            "alwaysai/human_pose", "pose", checker.backend, checker.backend_options)
+    image = np.zeros((1080, 1920, 3), dtype=np.uint8)
+
+    growth, peak = measure_allocations(checker.update, image, WARMUP_FRAMES, BLOCKS, BLOCK_FRAMES, clock)
+
+    assert checker.frame_count == WARMUP_FRAMES + BLOCKS * BLOCK_FRAMES
+    assert checker.pose_calls < checker.frame_count
+    assert sum(size for size, count in growth[1:]) < MAX_GROWTH, growth
+    assert sum(count for size, count in growth[1:]) < BLOCK_FRAMES, growth
+    assert peak < MAX_FRAME_PEAK, peak
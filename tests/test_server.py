@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "server"))
+
+from server import Aggregator, EventServer
+
+
+def run_with_server(test, history=16):
+    """Starts an EventServer on a free port, opens one connection and runs
+    test(server, reader, writer) against it.
+    """
+    async def main():
+        server = EventServer(Aggregator(history), "127.0.0.1", 0)
+        await server.start()
+        reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+        try:
+            await test(server, reader, writer)
+        finally:
+            writer.close()
+            await server.close()
+    asyncio.run(main())
+
+
+async def read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode('latin-1').partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers['content-length']))
+    return status, json.loads(body), headers
+
+
+async def request(reader, writer, method, path, payload=None):
+    body = b"" if payload is None else json.dumps(payload).encode()
+    writer.write("{} {} HTTP/1.1\r\nHost: test\r\nContent-Length: {}\r\n\r\n".format(
+        method, path, len(body)).encode('latin-1') + body)
+    await writer.drain()
+    return await read_response(reader)
+
+
+def waiting_event(device_id, masks, no_masks, time_marker="0"):
+    return {'device_id': device_id, 'time_marker': time_marker, 'in_area': [1, 2],
+            'covid_data': {'masks': masks, 'no_masks': no_masks, 'uncertain_masks': 0}}
+
+
+def test_batch_with_a_bad_event_applies_nothing():
+    async def test(server, reader, writer):
+        batch = [waiting_event("a", 1, 0), {'device_id': "b", 'in_area': 5}]
+        status, reply, _ = await request(reader, writer, "POST", "/events", batch)
+        assert status == 400
+        assert "event 1" in reply['error']
+        assert server.aggregator.devices == {}
+        assert server.aggregator.event_count == 0
+    run_with_server(test)
+
+
+def test_negative_counts_are_rejected():
+    async def test(server, reader, writer):
+        for event in [{'covid_data': {'masks': -5}}, {'post_vaccine_count': -1},
+                      {'hands_raised': -1}, {'vaccination_data': {'total_vaccinations': -2}}]:
+            status, reply, _ = await request(reader, writer, "POST", "/event", event)
+            assert status == 400, event
+            assert "negative" in reply['error']
+        assert server.aggregator.event_count == 0
+    run_with_server(test)
+
+
+def test_evicted_events_leave_mask_compliance():
+    async def test(server, reader, writer):
+        for masks, no_masks in [(3, 0), (0, 1), (1, 1)]:
+            status, _, _ = await request(reader, writer, "POST", "/event", waiting_event("a", masks, no_masks))
+            assert status == 200
+        device = server.aggregator.devices["a"]
+        assert len(device.events) == 2
+        assert (device.masks, device.no_masks, device.uncertain_masks) == (1, 2, 0)
+        status, rollup, _ = await request(reader, writer, "GET", "/rollup")
+        assert rollup['mask_compliance'] == round(1 / 3, 4)
+        assert rollup['events_received'] == 3
+    run_with_server(test, history=2)
+
+
+def test_keep_alive_serves_several_requests_on_one_connection():
+    async def test(server, reader, writer):
+        for index in range(3):
+            status, reply, headers = await request(reader, writer, "POST", "/event", waiting_event("a", 1, 0))
+            assert status == 200
+            assert reply['accepted'] == 1
+            assert headers['connection'] == "keep-alive"
+        status, rollup, _ = await request(reader, writer, "GET", "/rollup")
+        assert status == 200
+        assert rollup['events_received'] == 3
+        assert rollup['current_occupancy'] == 2
+    run_with_server(test)
+
+
+def test_device_events_limit():
+    async def test(server, reader, writer):
+        for index in range(5):
+            await request(reader, writer, "POST", "/event", waiting_event("a", 1, 0, str(index)))
+        status, events, _ = await request(reader, writer, "GET", "/devices/a?limit=2")
+        assert status == 200
+        assert [item['event']['time_marker'] for item in events] == ["3", "4"]
+        status, events, _ = await request(reader, writer, "GET", "/devices/a?limit=0")
+        assert events == []
+        status, events, _ = await request(reader, writer, "GET", "/devices/a")
+        assert len(events) == 5
+        status, _, _ = await request(reader, writer, "GET", "/devices/a?limit=abc")
+        assert status == 400
+        status, _, _ = await request(reader, writer, "GET", "/devices/missing")
+        assert status == 404
+    run_with_server(test)
+
+
+def test_full_distance_request_is_sent_once():
+    async def test(server, reader, writer):
+        status, _, _ = await request(reader, writer, "POST", "/devices/a/full-distances")
+        assert status == 200
+        _, reply, _ = await request(reader, writer, "POST", "/event", waiting_event("a", 1, 0))
+        assert reply.get('send_full_distances') is True
+        _, reply, _ = await request(reader, writer, "POST", "/event", waiting_event("a", 1, 0))
+        assert 'send_full_distances' not in reply
+    run_with_server(test)
+
+
+def test_malformed_request_line_gets_a_response():
+    async def test(server, reader, writer):
+        writer.write(b"GARBAGE\r\n\r\n")
+        await writer.drain()
+        status, reply, headers = await read_response(reader)
+        assert status == 400
+        assert headers['connection'] == "close"
+    run_with_server(test)
+
+
+def test_invalid_content_length_gets_a_response():
+    async def test(server, reader, writer):
+        writer.write(b"POST /event HTTP/1.1\r\nContent-Length: abc\r\n\r\n")
+        await writer.drain()
+        status, reply, _ = await read_response(reader)
+        assert status == 400
+        assert "content-length" in reply['error']
+    run_with_server(test)
@@ -0,0 +1,19 @@
+import filecmp
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# each app directory is its own build context, so shared modules are copied into it
+SHARED_MODULES = {
+    "inference.py": ["waiting", "vaccination", "post-vaccination"],
+    "queue_analytics.py": ["waiting", "vaccination"]
+}
+
+
+@pytest.mark.parametrize("module", sorted(SHARED_MODULES))
+def test_shared_module_copies_match(module):
+    first, *others = [os.path.join(ROOT, app, module) for app in SHARED_MODULES[module]]
+    for other in others:
+        assert filecmp.cmp(first, other, shallow=False), "{} differs from {}".format(other, first)
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("requests")
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TESTS_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "waiting"))
+
+import edgeiq_stub
+
+edgeiq_stub.install()
+
+import detection_manager
+from frame_loop import measure_allocations, quiet
+
+WARMUP_FRAMES = 400
+BLOCK_FRAMES = 200
+BLOCKS = 5
+MAX_GROWTH = 128 * 1024 # bytes kept after the first block
+MAX_FRAME_PEAK = 1024 * 1024 # bytes a frame may allocate on top, a frame copy is ~6 MiB
+
+
+def test_update_allocations_stay_flat(monkeypatch):
+    monkeypatch.setenv("INFERENCE_BACKEND", "fake")
+    monkeypatch.setattr(detection_manager, "send_data", lambda url, route, json: None)
+    with quiet():
+        manager = detection_manager.DetectionManager()
+    image = np.zeros((1080, 1920, 3), dtype=np.uint8)
+
+    growth, peak = measure_allocations(manager.update, image, WARMUP_FRAMES, BLOCKS, BLOCK_FRAMES)
+
+    assert manager.detector.latency.count == WARMUP_FRAMES + BLOCKS * BLOCK_FRAMES
+    assert sum(size for size, count in growth[1:]) < MAX_GROWTH, growth
+    assert peak < MAX_FRAME_PEAK, peak
@@ -34,7 +34,8 @@ def main():
                 vaccine_tracker.update(frame)
 
                 # draw the vaccination box in the frame
-                frame = edgeiq.markup_image(frame, [edgeiq.ObjectDetectionPrediction(label="vaccination", index=0, box=vaccine_tracker.box, confidence=100.00)])
+                frame = vaccine_tracker.markup_image(frame)
+                text = vaccine_tracker.get_latency_report()
                 streamer.send_data(frame, text)
                 fps.update()
 
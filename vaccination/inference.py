@@ -0,0 +1,321 @@
+"""
+Inference backends behind one interface, so the apps can switch between the
+edgeiq runtime, an ONNX Runtime CPU path for reduced-precision models, and a
+deterministic fake for benchmarks without changing the calling code.
+
+Select a backend with load_backend(model, task, backend, backend_options),
+where backend is one of BACKENDS. A backend that does not support the task
+falls back to edgeiq with a warning, so one INFERENCE_BACKEND setting can be
+shared by all the apps.
+"""
+
+import time
+from collections import deque
+
+import numpy as np
+import cv2
+import edgeiq
+
+BACKENDS = ["edgeiq", "onnxruntime", "fake"]
+
+
+class LatencyStats:
+    """Latency of the most recent calls to a backend.
+    """
+    def __init__(self, history=300):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=history)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def summary(self):
+        if self.count == 0:
+            return {'calls': 0, 'mean_ms': None, 'p95_ms': None}
+        recent = sorted(self.recent)
+        return {
+            'calls': self.count,
+            'mean_ms': round(1000 * self.total / self.count, 2),
+            'p95_ms': round(1000 * recent[min(int(len(recent) * 0.95), len(recent) - 1)], 2)
+        }
+
+
+class InferenceResults:
+    """Results in the shape of the edgeiq results the apps use.
+    """
+    __slots__ = ('predictions', 'poses', 'duration')
+
+    def __init__(self, predictions=None, poses=None, duration=0.0):
+        self.predictions = predictions if predictions is not None else []
+        self.poses = poses if poses is not None else []
+        self.duration = duration
+
+
+class InferenceBackend:
+    """Base class for backends. Subclasses implement _detect_objects and/or
+    _estimate, and the base class records the latency of every call.
+    """
+    name = None
+    tasks = ()
+
+    def __init__(self, model):
+        self.model_id = model
+        self.engine = None
+        self.accelerator = None
+        self.labels = []
+        self.latency = LatencyStats()
+
+    def detect_objects(self, image, confidence_level=0.3):
+        start = time.perf_counter()
+        results = self._detect_objects(image, confidence_level)
+        self.latency.add(time.perf_counter() - start)
+        return results
+
+    def estimate(self, image):
+        start = time.perf_counter()
+        results = self._estimate(image)
+        self.latency.add(time.perf_counter() - start)
+        return results
+
+    def _detect_objects(self, image, confidence_level):
+        raise NotImplementedError("{} backend does not support object detection".format(self.name))
+
+    def _estimate(self, image):
+        raise NotImplementedError("{} backend does not support pose estimation".format(self.name))
+
+    def latency_text(self):
+        stats = self.latency.summary()
+        if stats['calls'] == 0:
+            return "{} ({}): no calls".format(self.model_id, self.name)
+        return "{} ({}): {} calls, mean {:.1f} ms, p95 {:.1f} ms".format(
+            self.model_id, self.name, stats['calls'], stats['mean_ms'], stats['p95_ms'])
+
+    def print_details(self):
+        print("Model:\n{}\n".format(self.model_id))
+        print("Backend: {}".format(self.name))
+        print("Engine: {}".format(self.engine))
+        print("Accelerator: {}\n".format(self.accelerator))
+        print("Labels:\n{}\n".format(self.labels))
+
+
+class EdgeIQBackend(InferenceBackend):
+    """The edgeiq runtime, as used by the apps so far.
+    """
+    name = "edgeiq"
+    tasks = ("detection", "pose")
+
+    def __init__(self, model, task="detection", engine="DNN", accelerator=None):
+        super().__init__(model)
+        if task == "pose":
+            self._model = edgeiq.PoseEstimation(model)
+        else:
+            self._model = edgeiq.ObjectDetection(model)
+
+        options = {'engine': getattr(edgeiq.Engine, engine) if isinstance(engine, str) else engine}
+        if accelerator is not None:
+            options['accelerator'] = getattr(edgeiq.Accelerator, accelerator) if isinstance(accelerator, str) else accelerator
+        self._model.load(**options)
+
+        self.model_id = self._model.model_id
+        self.engine = self._model.engine
+        self.accelerator = self._model.accelerator
+        self.labels = getattr(self._model, 'labels', [])
+
+    def _detect_objects(self, image, confidence_level):
+        return self._model.detect_objects(image, confidence_level=confidence_level)
+
+    def _estimate(self, image):
+        return self._model.estimate(image)
+
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """Object detection with ONNX Runtime on the CPU, for models exported to
+    ONNX and quantized to INT8 or converted to FP16.
+
+    The model must take one image input (NCHW, RGB, scaled to 0-1 for float
+    inputs) and output detections after NMS as rows of
+    [start_x, start_y, end_x, end_y, confidence, class index] in input pixels.
+    Models exported with dynamic height and width need input_size set to
+    the (width, height) to resize frames to.
+    """
+    name = "onnxruntime"
+    tasks = ("detection",)
+
+    def __init__(self, model, task="detection", model_path=None, labels_path=None, threads=0, input_size=None):
+        super().__init__(model)
+        if task != "detection":
+            raise ValueError("onnxruntime backend only supports object detection")
+        if model_path is None:
+            raise ValueError("onnxruntime backend needs a model_path for {}".format(model))
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("onnxruntime backend needs the onnxruntime package (pip install onnxruntime)")
+
+        session_options = onnxruntime.SessionOptions()
+        session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        session_options.intra_op_num_threads = threads # 0 lets the runtime choose
+        self._session = onnxruntime.InferenceSession(
+            model_path, sess_options=session_options, providers=["CPUExecutionProvider"])
+
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        if input_size is not None:
+            self._input_width, self._input_height = int(input_size[0]), int(input_size[1])
+        elif len(model_input.shape) == 4 and all(isinstance(size, int) for size in model_input.shape[2:]):
+            self._input_height, self._input_width = model_input.shape[2], model_input.shape[3]
+        else:
+            raise ValueError("{} has input shape {}, set input_size to (width, height) in its backend options".format(
+                model_path, model_input.shape))
+        self._input_type = {'tensor(uint8)': np.uint8, 'tensor(float16)': np.float16}.get(model_input.type, np.float32)
+
+        self.engine = "onnxruntime {}".format(onnxruntime.__version__)
+        self.accelerator = "CPU"
+        if labels_path is not None:
+            with open(labels_path) as labels:
+                self.labels = [line.strip() for line in labels if line.strip()]
+
+    def _detect_objects(self, image, confidence_level):
+        start = time.time()
+        height, width = image.shape[:2]
+        resized = cv2.resize(image, (self._input_width, self._input_height))
+        blob = resized[:, :, ::-1].transpose(2, 0, 1)[np.newaxis]
+        if self._input_type == np.uint8:
+            blob = np.ascontiguousarray(blob)
+        else:
+            blob = blob.astype(self._input_type) / 255
+
+        detections = self._session.run(None, {self._input_name: blob})[0].reshape(-1, 6)
+        scale_x, scale_y = width / self._input_width, height / self._input_height
+
+        predictions = []
+        for start_x, start_y, end_x, end_y, confidence, index in detections:
+            if confidence < confidence_level:
+                continue
+            index = int(index)
+            label = self.labels[index] if index < len(self.labels) else str(index)
+            box = edgeiq.BoundingBox(int(start_x * scale_x), int(start_y * scale_y),
+                                     int(end_x * scale_x), int(end_y * scale_y))
+            predictions.append(edgeiq.ObjectDetectionPrediction(
+                box=box, confidence=float(confidence), label=label, index=index))
+        return InferenceResults(predictions=predictions, duration=time.time() - start)
+
+
+class FakeKeyPoint:
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class FakePose:
+    __slots__ = ('key_points',)
+
+    def __init__(self, key_points):
+        self.key_points = key_points
+
+
+class FakeBackend(InferenceBackend):
+    """Deterministic stand-in for benchmarks: people walk back and forth on
+    fixed paths at a fixed speed in clock time, so calling the backend on
+    fewer frames (e.g. pose estimation every Nth frame) does not slow the
+    scene down. For reproducible runs pass a clock that advances by 1/fps
+    for every frame the app processes.
+    """
+    name = "fake"
+    tasks = ("detection", "pose")
+
+    def __init__(self, model, task="detection", people=4, labels=None, delay=0.0, fps=15, clock=None,
+                 raise_hands=True):
+        super().__init__(model)
+        self.people = people
+        self.raise_hands = raise_hands # False keeps every pose's hands down
+        self.labels = labels or ["person"]
+        self.delay = delay # seconds added to every call to mimic a model
+        self.fps = fps # scene frames per second of clock time
+        self.clock = clock or time.monotonic
+        self.engine = "fake"
+        self.accelerator = "none"
+        self._start_time = None
+
+    def scene_frame(self):
+        """Returns the scene frame for the current clock time.
+        """
+        now = self.clock()
+        if self._start_time is None:
+            self._start_time = now
+        return int((now - self._start_time) * self.fps)
+
+    def _positions(self, image, frame):
+        height, width = image.shape[:2]
+        for index in range(self.people):
+            span = max(width - 200, 1)
+            offset = (frame * (3 + index) + index * span // max(self.people, 1)) % (2 * span)
+            x = offset if offset < span else 2 * span - offset
+            y = (index * 150) % max(height - 400, 1)
+            yield index, x, y
+
+    def _detect_objects(self, image, confidence_level):
+        if self.delay:
+            time.sleep(self.delay)
+        frame = self.scene_frame()
+        predictions = []
+        for index, x, y in self._positions(image, frame):
+            # labels rotate every 30 frames so each one shows up
+            label_index = (index + frame // 30) % len(self.labels)
+            box = edgeiq.BoundingBox(x, y, x + 120, y + 360)
+            predictions.append(edgeiq.ObjectDetectionPrediction(
+                box=box, confidence=1.0, label=self.labels[label_index], index=label_index))
+        return InferenceResults(predictions=predictions, duration=self.delay)
+
+    def _estimate(self, image):
+        if self.delay:
+            time.sleep(self.delay)
+        frame = self.scene_frame()
+        poses = []
+        for index, x, y in self._positions(image, frame):
+            # every other person raises the left hand for a while now and then
+            raised = self.raise_hands and index % 2 == 0 and (frame // 90) % 3 == 0
+            poses.append(FakePose({
+                'Neck': FakeKeyPoint(x + 60, y + 60),
+                'Left Shoulder': FakeKeyPoint(x + 90, y + 70),
+                'Left Elbow': FakeKeyPoint(x + 100, y + (20 if raised else 130)),
+                'Right Shoulder': FakeKeyPoint(x + 30, y + 70),
+                'Right Elbow': FakeKeyPoint(x + 20, y + 130)
+            }))
+        return InferenceResults(poses=poses, duration=self.delay)
+
+
+BACKEND_CLASSES = {
+    "edgeiq": EdgeIQBackend,
+    "onnxruntime": OnnxRuntimeBackend,
+    "fake": FakeBackend
+}
+
+
+def load_backend(model, task="detection", backend="edgeiq", backend_options=None):
+    """Creates the backend for a model, falling back to edgeiq when the
+    selected backend does not support the task.
+
+    Args:
+        model (string): The alwaysAI model ID
+        task (string): "detection" or "pose"
+        backend (string): One of BACKENDS
+        backend_options (dict): Constructor keyword arguments by backend, then by model
+
+    Returns:
+        InferenceBackend: The loaded backend
+    """
+    if backend not in BACKEND_CLASSES:
+        raise ValueError("Unknown backend {}, expected one of {}".format(backend, BACKENDS))
+    if task not in BACKEND_CLASSES[backend].tasks:
+        print("[WARNING] {} backend does not support {}, using edgeiq for {}".format(backend, task, model))
+        backend = "edgeiq"
+    options = (backend_options or {}).get(backend, {}).get(model, {})
+    loaded = BACKEND_CLASSES[backend](model, task, **options)
+    loaded.print_details()
+    return loaded
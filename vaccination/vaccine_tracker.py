@@ -5,7 +5,11 @@ import time
 import datetime
 import requests
 
+import numpy as np
+import cv2
 import edgeiq
+from queue_analytics import QueueAnalytics, RollingAggregate
+from inference import load_backend
 
 def send_data(url, route, json):
     try:
@@ -21,13 +25,29 @@ class VaccineTracker():
         self.server_event_url = "http://localhost:5001/" # configure as needed
         self._start_time = time.time()
 
+        # inference backend: "edgeiq", "onnxruntime" or "fake", configure as needed
+        self.backend = os.environ.get("INFERENCE_BACKEND", "edgeiq")
+        self.backend_options = { # options per backend and model, configure as needed
+            "edgeiq": {
+                "alwaysai/yolov3": {"engine": "DNN"}
+            },
+            "onnxruntime": {
+                # "alwaysai/yolov3": {"model_path": "models/yolov3_int8.onnx", "labels_path": "models/coco_labels.txt"}
+            },
+            "fake": {
+                "alwaysai/yolov3": {"people": 2, "labels": ["person"]}
+            }
+        }
+
         # detection model
         self.detector = self.load_model("alwaysai/yolov3")
 
-        self.centroid_tracker = edgeiq.CentroidTracker(deregister_frames=4, max_distance=130) # configure as needed
+        self.deregister_frames = 4 # configure as needed
+        self.centroid_tracker = edgeiq.CentroidTracker(deregister_frames=self.deregister_frames, max_distance=130) # configure as needed
         
         # vaccination box
         self.box = edgeiq.BoundingBox(1269, 187, 1920, 1080) # configure as needed
+        self._frame = None # reused for markup
         
         # for overall vaccination logic, configure as needed
         self.current_ids = []
@@ -37,23 +57,24 @@ class VaccineTracker():
         self.scheduled_vaccinations = 20
         self.doses_per_vial = 10
         self.last_apt = datetime.datetime.today().replace(hour=16, minute=45)
+
+        # dwell time in the vaccination area and completed vaccinations over the last hour
+        self.window = 3600 # configure as needed
+        self.queue_analytics = QueueAnalytics(window=self.window, grace_frames=self.deregister_frames)
+        self.completions = RollingAggregate(window=self.window)
         self.send_event(0)
 
     def has_events(self):
         return self._send_events
 
     def load_model(self, model):
-        # start up a first object detection model
-        obj_detect = edgeiq.ObjectDetection(model)
-        obj_detect.load(engine=edgeiq.Engine.DNN)
-
-        # print the details of each model to the console
-        print("Model:\n{}\n".format(obj_detect.model_id))
-        print("Engine: {}".format(obj_detect.engine))
-        print("Accelerator: {}\n".format(obj_detect.accelerator))
-        print("Labels:\n{}\n".format(obj_detect.labels))
+        # start up an object detection model on the configured backend
+        return load_backend(model, "detection", self.backend, self.backend_options)
 
-        return obj_detect	
+    def get_latency_report(self):
+        """Returns a line of inference latency for each model.
+        """
+        return [self.detector.latency_text()]
 
     def has_expired(self):
         expired = self.timestamp is not None and \
@@ -62,6 +83,7 @@ class VaccineTracker():
         
     def send_event(self, vaccinations=0):
         event_log = {}
+        event_log['device_id'] = self.id
         event_log['time_marker'] = str(round((time.time() - self._start_time), 2))
         vaccination_data = {}
         vaccination_data['new_vaccinations'] = vaccinations
@@ -70,10 +92,40 @@ class VaccineTracker():
         vaccination_data['doses_left_in_current_vial'] = self.calculate_doses_in_current_vial()
         vaccination_data['appointments_remaining'] = self.scheduled_vaccinations - self.total_vaccinations
         vaccination_data['last_apt'] = str(self.last_apt)
+        vaccination_data['throughput_forecast'] = self.forecast_throughput()
         event_log['vaccination_data'] = vaccination_data
+        event_log['queue_data'] = self.queue_analytics.summary()
+        event_log['inference_latency'] = {self.detector.model_id: self.detector.latency.summary()}
         print("event_log " + json.dumps(event_log, indent=4))
         send_data(self.server_event_url, "event", event_log)
 
+    def forecast_throughput(self):
+        """Projects how many of the remaining appointments can be completed
+        before last_apt at the vaccination rate of the last window.
+
+        Returns:
+            dict: Current and required rates per hour, projected vaccinations
+            before last_apt and the projected finish time
+        """
+        now = datetime.datetime.now()
+        completions = self.completions.snapshot()
+        hours_observed = max(self.completions.covered(since=self._start_time), 60) / 3600
+        rate = completions.count / hours_observed
+        remaining = max(self.scheduled_vaccinations - self.total_vaccinations, 0)
+        hours_left = max((self.last_apt - now).total_seconds() / 3600, 0)
+
+        forecast = {}
+        forecast['vaccinations_per_hour'] = round(rate, 2)
+        forecast['required_per_hour'] = round(remaining / hours_left, 2) if hours_left > 0 else None
+        forecast['projected_before_last_apt'] = min(int(rate * hours_left), remaining)
+        forecast['projected_finish'] = None
+        if remaining == 0:
+            forecast['projected_finish'] = str(now)
+        elif rate > 0:
+            forecast['projected_finish'] = str(now + datetime.timedelta(hours=remaining / rate))
+        forecast['on_schedule'] = forecast['projected_before_last_apt'] >= remaining
+        return forecast
+
     def calculate_vials_opened(self):
         if self.total_vaccinations == 0:
             return 0
@@ -89,6 +141,25 @@ class VaccineTracker():
                 in_area.append(key)
         return in_area
 
+    def markup_image(self, image):
+        """Draws the vaccination box onto a frame buffer that is reused
+        between calls, instead of allocating a marked up copy every frame.
+
+        Args:
+            image (numpy array): The frame to mark up
+
+        Returns:
+            numpy array: The marked up frame, overwritten on the next call
+        """
+        if self._frame is None or self._frame.shape != image.shape:
+            self._frame = np.empty_like(image)
+        np.copyto(self._frame, image)
+        cv2.rectangle(self._frame, (self.box.start_x, self.box.start_y),
+                      (self.box.end_x, self.box.end_y), (255, 0, 0), 2)
+        cv2.putText(self._frame, "vaccination", (self.box.start_x, self.box.start_y + 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2)
+        return self._frame
+
     def update(self, image):
         # if someone is in the chair -- we're waiting for a vaccine
         results = self.detector.detect_objects(image, confidence_level=0.6)
@@ -98,6 +169,7 @@ class VaccineTracker():
             # now check how many people are in the vaccination areas
             predictions = self.centroid_tracker.update(people_pred)
             keys = self.check_overlap(predictions)
+            self.queue_analytics.update(keys)
       
             if len(keys) == 2 and len(self.current_ids) == 0:
                 # start tracking
@@ -107,6 +179,10 @@ class VaccineTracker():
             elif len(keys) <= 2:
                 if self.has_expired():
                     self.total_vaccinations += 1
+                    self.completions.add(1)
                     self.timestamp = None
                     self.current_ids = []
                     self.send_event(1)
+        else:
+            # an empty frame counts as a missed frame for every open dwell timer
+            self.queue_analytics.update([])
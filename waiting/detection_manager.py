@@ -1,22 +1,24 @@
 import time
-import itertools
 from math import sqrt
-from copy import deepcopy
 import os
 import json
 import requests
 
 import numpy as np
+import cv2
 import edgeiq
+from queue_analytics import QueueAnalytics
+from inference import load_backend
 
 START_TIME = time.time()
 
 def send_data(url, route, json):
     try:
         url = url + route
-        requests.post(url=url, json=json)
+        return requests.post(url=url, json=json)
     except:
         print("connection error, unable to send request")
+        return None
 
 class InterestItem:
     """This class is used to calculate the distance scale.
@@ -33,6 +35,41 @@ class InterestItem:
     def get_area(self):
         return self.width * self.height
 
+class BoxRecord:
+    """Compact box in frame coordinates, reused between frames.
+    """
+    __slots__ = ('start_x', 'start_y', 'end_x', 'end_y')
+
+    def __init__(self):
+        self.start_x = self.start_y = self.end_x = self.end_y = 0
+
+    def set(self, start_x, start_y, end_x, end_y):
+        self.start_x = int(start_x)
+        self.start_y = int(start_y)
+        self.end_x = int(end_x)
+        self.end_y = int(end_y)
+
+    @property
+    def width(self):
+        return self.end_x - self.start_x
+
+    @property
+    def height(self):
+        return self.end_y - self.start_y
+
+
+class PredictionRecord:
+    """Compact stand-in for an ObjectDetectionPrediction, with the fields
+    needed to mark up and count mask results.
+    """
+    __slots__ = ('label', 'confidence', 'box')
+
+    def __init__(self):
+        self.label = None
+        self.confidence = 0.0
+        self.box = BoxRecord()
+
+
 class DetectionManager:
     def __init__(self):
         # client configuration
@@ -43,6 +80,28 @@ class DetectionManager:
             # 'chair1': 1
         }
         self.capacity = 4 # configure as needed
+        self.min_distance = 42 # inches, configure as needed
+        self.distance_mode = "summary" # "summary" or "full" (every pair), configure as needed
+        self.full_distances_interval = 0 # in summary mode, add the full pairs every N frames with people, 0 for never, configure as needed
+        self.distance_bins = [0, 24, 42, 72, 120, 180] # inches, lower edge of each histogram bin
+        self._full_distances_requested = False
+        self._frames_since_full_distances = 0
+
+        # inference backend: "edgeiq", "onnxruntime" or "fake", configure as needed
+        self.backend = os.environ.get("INFERENCE_BACKEND", "edgeiq")
+        self.backend_options = { # options per backend and model, configure as needed
+            "edgeiq": {
+                "alwaysai/yolov3": {"engine": "DNN", "accelerator": "CPU"},
+                "<username>/<model_name>": {"engine": "DNN", "accelerator": "CPU"}
+            },
+            "onnxruntime": {
+                # "alwaysai/yolov3": {"model_path": "models/yolov3_int8.onnx", "labels_path": "models/coco_labels.txt"}
+            },
+            "fake": {
+                "alwaysai/yolov3": {"people": 6, "labels": ["person"]},
+                "<username>/<model_name>": {"people": 1, "labels": ["mask", "no-mask"]}
+            }
+        }
 
         # detection models
         self.detector = self.load_model("alwaysai/yolov3")
@@ -54,7 +113,19 @@ class DetectionManager:
         }
 
         # tracker to associate object ids with predictions
-        self.centroid_tracker = edgeiq.CentroidTracker(deregister_frames=4, max_distance=130)
+        self.deregister_frames = 4 # configure as needed
+        self.centroid_tracker = edgeiq.CentroidTracker(deregister_frames=self.deregister_frames, max_distance=130)
+
+        # dwell time and queue length over the last hour
+        # a track missing for fewer frames than the tracker keeps its ID keeps its timer
+        self.queue_analytics = QueueAnalytics(window=3600, grace_frames=self.deregister_frames) # configure as needed
+
+        # buffers reused every frame to keep per frame allocations flat
+        self._interest_labels = list(self.interest_items.keys())
+        self._mask_records = []
+        self._mask_results = []
+        self._frame = None
+        self._event = {}
 
         self.covid_event_log = {}
         self.event_log = {}
@@ -71,21 +142,20 @@ class DetectionManager:
         setup['device_id'] = self.id
         setup['area'] = self.capacity
         setup['chairs'] = self.chairs
+        setup['distance_bins'] = self.distance_bins
+        setup['distance_mode'] = self.distance_mode
+        setup['full_distances_interval'] = self.full_distances_interval
         print("[INFO] sending set up " + str(setup))
         send_data(self.server_event_url, "setup", setup)
     
     def load_model(self, model):
-        # start up a first object detection model
-        obj_detect = edgeiq.ObjectDetection(model)
-        obj_detect.load(engine=edgeiq.Engine.DNN, accelerator=edgeiq.Accelerator.CPU)
-
-        # print the details of each model to the console
-        print("Model:\n{}\n".format(obj_detect.model_id))
-        print("Engine: {}".format(obj_detect.engine))
-        print("Accelerator: {}\n".format(obj_detect.accelerator))
-        print("Labels:\n{}\n".format(obj_detect.labels))
+        # start up an object detection model on the configured backend
+        return load_backend(model, "detection", self.backend, self.backend_options)
 
-        return obj_detect	
+    def get_latency_report(self):
+        """Returns a line of inference latency for each model.
+        """
+        return [self.detector.latency_text(), self.mask_detector.latency_text()]
     
     def get_mask_results(self, predictions, image):
         """Searches each prediction box section of the input image for a mask,
@@ -96,10 +166,15 @@ class DetectionManager:
             image (numpy array): The image to inference on
 
         Returns:
-            list: Returns a list of ObjectDetectionPrediction elements
+            list: Returns a list of PredictionRecord elements, reused on the next call
         """
-        mask_results = []
-        for prediction in deepcopy(predictions):
+        mask_results = self._mask_results
+        del mask_results[:]
+        for index, prediction in enumerate(predictions):
+            if index == len(self._mask_records):
+                self._mask_records.append(PredictionRecord())
+            record = self._mask_records[index]
+            record.confidence = prediction.confidence
 
             # use the person prediction to narrow the focus and search for masks
             new_image = edgeiq.cutout_image(image, prediction.box)
@@ -109,21 +184,19 @@ class DetectionManager:
                 pred = mask_predictions[0]
 
                 # update the label with the mask model's label if it is found
-                prediction.label = pred.label
+                record.label = pred.label
 
                 # make the new box in the original frame
                 new_start_x = prediction.box.start_x + pred.box.start_x
-                new_end_x = new_start_x + pred.box.width
                 new_start_y = prediction.box.start_y + pred.box.start_y
-                new_end_y = new_start_y + pred.box.height
-
-                # send back this new box to be marked up in the frame
-                new_box = edgeiq.BoundingBox(new_start_x, new_start_y, new_end_x, new_end_y)
-                prediction.box = new_box
+                record.box.set(new_start_x, new_start_y,
+                               new_start_x + pred.box.width, new_start_y + pred.box.height)
             else:
-                prediction.label = "no-mask-detected"
+                record.label = "no-mask-detected"
+                box = prediction.box
+                record.box.set(box.start_x, box.start_y, box.end_x, box.end_y)
 
-            mask_results.append(prediction)
+            mask_results.append(record)
         return mask_results
 
     def get_distances(self, predictions):
@@ -131,6 +204,12 @@ class DetectionManager:
         the event_log with additional data, and returns lists of people who
         are distanced and people who are not.
 
+        By default only a compact summary is logged: a histogram of pair
+        distances, the violating pairs, the minimum distance per person and
+        the average distance. The full pair dictionary is added when
+        distance_mode is "full", every full_distances_interval frames, or once
+        after the server asks for it in an event reply (see check_server_reply).
+
         Args:
             predictions (ObjectDetectionPrediction): A list of predictions
 
@@ -138,45 +217,90 @@ class DetectionManager:
             (list, list): Returns a list of people who are distanced 
             and a list of people who are not
         """
-        badkeys = set()
-        goodlist, badlist, pairlist = {}, {}, {}
-        pixel_scale, sum_dist, count = 0, 0, 0
-        pairs = itertools.combinations(predictions.keys(), 2)
-        for pair in pairs:
-            count += 1
-            
-            # calculate scale as pixels per inch
-            p1 = predictions.get(pair[0])
-            p2 = predictions.get(pair[1])
-            pixel_scale = self.get_pixel_scale([p1, p2])
-            
-            if pixel_scale > 0:
-                # calculate distance in inches by dividing pixels by pixels per inch
-                dist = p1.box.compute_distance(p2.box)/pixel_scale
-                sum_dist += dist
-                pairlist['{}-{}'.format(pair[0], pair[1])] = dist
-                if dist < 42: # configure as needed
-                    if pair[0] not in badkeys:
-                        badlist[pair[0]] = p1
-                    
-                    if pair[1] not in badkeys:
-                        badlist[pair[1]] = p2
-                    badkeys.add(pair[0])
-                    badkeys.add(pair[1])
-        
-        for key in predictions.keys():
-            if key not in badkeys:
+        goodlist, badlist = {}, {}
+        keys = list(predictions.keys())
+        self._frames_since_full_distances += 1
+        if self.full_distances_interval > 0 and self._frames_since_full_distances >= self.full_distances_interval:
+            self._full_distances_requested = True
+        send_full = self.distance_mode == "full" or self._full_distances_requested
+        if send_full:
+            self._full_distances_requested = False
+            self._frames_since_full_distances = 0
+
+        summary = {
+            'histogram': [0] * len(self.distance_bins),
+            'violations': [],
+            'min_distance': {}
+        }
+        pairlist = {}
+        ave_distance = 0
+
+        if len(keys) > 1:
+            preds = [predictions[key] for key in keys]
+            centers = np.array([pred.box.center for pred in preds], dtype=np.float64)
+
+            # per person scale in pixels per inch, 0 if the label has no reference item
+            scales = np.array([self.get_pixel_scale([pred]) for pred in preds], dtype=np.float64)
+            has_scale = (scales > 0).astype(np.float64)
+
+            # calculate scale per pair as the average of the valid individual scales
+            first, second = np.triu_indices(len(keys), k=1)
+            scale_count = has_scale[first] + has_scale[second]
+            pair_scale = np.divide(scales[first] + scales[second], scale_count,
+                                   out=np.zeros(len(first)), where=scale_count > 0)
+            valid = pair_scale > 0
+            first, second = first[valid], second[valid]
+
+            # calculate distance in inches by dividing pixels by pixels per inch
+            pixels = np.hypot(*(centers[first] - centers[second]).T)
+            dists = pixels / pair_scale[valid]
+
+            if len(dists) > 0:
+                # the average keeps the original definition over all pairs
+                ave_distance = float(dists.sum()) / (len(keys) * (len(keys) - 1) // 2)
+
+                edges = np.append(self.distance_bins, np.inf)
+                summary['histogram'] = np.histogram(dists, bins=edges)[0].tolist()
+
+                nearest = np.full(len(keys), np.inf)
+                np.minimum.at(nearest, first, dists)
+                np.minimum.at(nearest, second, dists)
+                for index, value in enumerate(nearest):
+                    if np.isfinite(value):
+                        summary['min_distance'][keys[index]] = round(float(value), 1)
+
+                bad = np.flatnonzero(dists < self.min_distance)
+                badkeys = set()
+                for index in bad:
+                    p1, p2 = keys[first[index]], keys[second[index]]
+                    summary['violations'].append([p1, p2, round(float(dists[index]), 1)])
+                    badkeys.add(p1)
+                    badkeys.add(p2)
+                for key in keys:
+                    if key in badkeys:
+                        badlist[key] = predictions[key]
+
+                if send_full:
+                    for index, dist in enumerate(dists.tolist()):
+                        pairlist['{}-{}'.format(keys[first[index]], keys[second[index]])] = dist
+
+        for key in keys:
+            if key not in badlist:
                 goodlist[key] = predictions[key]
-        
-        if count > 0:
-            ave_distance = sum_dist/count
-        else:
-            ave_distance = 0
-        self.covid_event_log['distances'] = pairlist
+
+        self.covid_event_log['distance_summary'] = summary
+        if send_full:
+            self.covid_event_log['distances'] = pairlist
         self.covid_event_log['ave_distance'] = ave_distance
         
         return goodlist, badlist
 
+    def request_full_distances(self):
+        """Includes the full pair distance dictionary in the next event only.
+        Called when the server replies to an event with send_full_distances.
+        """
+        self._full_distances_requested = True
+
     def get_pixel_scale(self, predictions):
         """Calculates the appropriate scale for the passed in predication.
 
@@ -207,8 +331,9 @@ class DetectionManager:
         Returns:
             (image, text): Returns the marked up image and text of the application status
         """
-        self.covid_event_log = {}
+        self.covid_event_log.clear()
         goodlist, badlist, mask_pred, no_mask_pred = [], [], [], []
+        keys = []
         text = []
         self.covid_event_log['people_not_distanced'] = []
         self.covid_event_log['people_distanced'] = []
@@ -220,7 +345,7 @@ class DetectionManager:
         results = self.detector.detect_objects(image, confidence_level=0.99)
         
         # filter by labels of interest (i.e. 'person')
-        people_pred = edgeiq.filter_predictions_by_label(results.predictions, list(self.interest_items.keys()))
+        people_pred = edgeiq.filter_predictions_by_label(results.predictions, self._interest_labels)
         if len(people_pred) > 0:
         
             # send them to the centroid_tracker tracker
@@ -229,22 +354,21 @@ class DetectionManager:
 
             # get area update
             keys = self.check_overlap(tracked_people_pred)
-
-            new_predictions = {}
-            for object_id, prediction in tracked_people_pred.items():
-                if object_id in keys:
-                    new_predictions[object_id] = prediction
+            new_predictions = {object_id: tracked_people_pred[object_id] for object_id in keys}
         
             # map tracked objects to distance detection
             good_dist, bad_dist = self.get_distances(new_predictions)
 
-            goodlist.extend(list(good_dist.values()))
-            badlist.extend(list(bad_dist.values()))
+            goodlist.extend(good_dist.values())
+            badlist.extend(bad_dist.values())
 
             self.covid_event_log['people_not_distanced'] = list(bad_dist.keys())
             self.covid_event_log['people_distanced'] = list(good_dist.keys())
             text.append("{} people not distanced\n".format(len(bad_dist)))
 
+        # update dwell timers, an empty frame counts as a missed frame for every open timer
+        self.queue_analytics.update(keys)
+
         # map tracked objects to mask_detection
         mask_predictions = self.get_mask_results(people_pred, image)
         #print("mask_predictions {}".format(mask_predictions))
@@ -263,17 +387,44 @@ class DetectionManager:
         goodlist.extend(mask_pred)
         badlist.extend(no_mask_pred)
 
-        image = edgeiq.markup_image(
-                        image, badlist, show_labels=True, line_thickness=2, font_size=2, font_thickness=3, show_confidences=False, colors=[(0,0,255)])
-        
-        image = edgeiq.markup_image(
-                        image, goodlist, show_labels=True, line_thickness=2, font_size=2, font_thickness=3, show_confidences=False, colors=[(12,105,7)])
+        # mark up a reused copy of the frame instead of allocating one per call
+        if self._frame is None or self._frame.shape != image.shape:
+            self._frame = np.empty_like(image)
+        np.copyto(self._frame, image)
+        image = self.markup_image(self._frame, badlist, (0,0,255))
+        image = self.markup_image(image, goodlist, (12,105,7))
+
+        text.extend(self.get_latency_report())
 
         # send any relevant results to the server
         self.check_for_events()
         
         return image, text
 
+    def markup_image(self, image, predictions, color):
+        """Draws the box and label of each prediction onto image in place,
+        matching the style the app used with edgeiq.markup_image.
+
+        Args:
+            image (numpy array): The image to draw on
+            predictions (list): ObjectDetectionPrediction or PredictionRecord elements
+            color (tuple): BGR color of the boxes
+
+        Returns:
+            numpy array: The same image
+        """
+        for prediction in predictions:
+            box = prediction.box
+            start = (int(box.start_x), int(box.start_y))
+            cv2.rectangle(image, start, (int(box.end_x), int(box.end_y)), color, 2)
+
+            (text_width, text_height), baseline = cv2.getTextSize(prediction.label, cv2.FONT_HERSHEY_SIMPLEX, 2, 3)
+            top = max(start[1] - text_height - baseline, 0)
+            cv2.rectangle(image, (start[0], top), (start[0] + text_width, top + text_height + baseline), color, -1)
+            cv2.putText(image, prediction.label, (start[0], top + text_height),
+                        cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+        return image
+
     def check_overlap(self, people_predictions):
         """Checks for overlap of each person in people_predictions with the
         overall application box. You can add checks for chairs as well.
@@ -315,9 +466,31 @@ class DetectionManager:
     
     def check_for_events(self):
         if len(self.event_log) > 0:
-            event_log = deepcopy(self.event_log)
+            # the event is posted before the next frame, so one dict is reused
+            event_log = self._event
+            event_log.update(self.event_log)
             event_log['device_id'] = self.id
             event_log['time_marker'] = str(round((time.time() - START_TIME), 2))
             event_log['covid_data'] = self.covid_event_log
+            event_log['queue_data'] = self.queue_analytics.summary()
+            event_log['inference_latency'] = {
+                self.detector.model_id: self.detector.latency.summary(),
+                self.mask_detector.model_id: self.mask_detector.latency.summary()
+            }
             print("event_log " + json.dumps(event_log, indent=4))
-            send_data(self.server_event_url, "event", event_log)
+            response = send_data(self.server_event_url, "event", event_log)
+            self.check_server_reply(response)
+
+    def check_server_reply(self, response):
+        """Acts on requests the server includes in its reply to an event,
+        currently send_full_distances for one full pair distance dump.
+
+        Args:
+            response (requests.Response): The reply, or None if the post failed
+        """
+        try:
+            reply = response.json()
+        except (AttributeError, ValueError):
+            return
+        if isinstance(reply, dict) and reply.get('send_full_distances'):
+            self.request_full_distances()
@@ -0,0 +1,209 @@
+import time
+from math import ceil, floor, log
+
+
+class QuantileSketch:
+    """Streaming quantile estimate with bounded relative error.
+
+    Values are counted in logarithmic buckets, so memory depends on the
+    range of values seen and not on how many were added.
+    """
+    def __init__(self, relative_accuracy=0.02, min_value=0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = log(self.gamma)
+        self.min_value = min_value
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+
+    def clear(self):
+        self.buckets.clear()
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+        if value < self.min_value:
+            self.zero_count += 1
+        else:
+            index = int(ceil(log(value) / self._log_gamma))
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count
+
+    def quantile(self, q):
+        """Returns the estimated value at quantile q (0 to 1), or None if empty.
+        """
+        if self.count == 0:
+            return None
+        rank = floor(q * (self.count - 1))
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                return min(2 * self.gamma ** index / (self.gamma + 1), self.max)
+        return self.max
+
+
+class RollingAggregate:
+    """Count, mean, max and quantiles of the values added in the last
+    window seconds, kept as a ring of fixed time slices.
+    """
+    def __init__(self, window=3600, slices=12, relative_accuracy=0.02):
+        self.window = window
+        self.slice_length = window / slices
+        self._epochs = [None] * slices
+        self._sketches = [QuantileSketch(relative_accuracy) for _ in range(slices)]
+        self._merged = QuantileSketch(relative_accuracy)
+
+    def _current(self, now):
+        epoch = int(now // self.slice_length)
+        position = epoch % len(self._epochs)
+        if self._epochs[position] != epoch:
+            self._epochs[position] = epoch
+            self._sketches[position].clear()
+        return self._sketches[position]
+
+    def add(self, value, now=None):
+        now = time.time() if now is None else now
+        self._current(now).add(value)
+
+    def snapshot(self, now=None):
+        """Merges the slices that are still inside the window.
+
+        Returns:
+            QuantileSketch: A sketch of every value in the window
+        """
+        now = time.time() if now is None else now
+        oldest = int(now // self.slice_length) - len(self._epochs) + 1
+        self._merged.clear()
+        for epoch, sketch in zip(self._epochs, self._sketches):
+            if epoch is not None and epoch >= oldest:
+                self._merged.merge(sketch)
+        return self._merged
+
+    def covered(self, now=None, since=None):
+        """Returns how many seconds the slices in the window cover, counted
+        from since if that is later than the oldest slice.
+        """
+        now = time.time() if now is None else now
+        oldest = (int(now // self.slice_length) - len(self._epochs) + 1) * self.slice_length
+        if since is not None:
+            oldest = max(oldest, since)
+        return max(now - oldest, 0)
+
+
+class QueueAnalytics:
+    """Keeps per-track dwell timers for an area and windowed aggregates of
+    dwell time, arrivals and occupancy.
+    """
+    def __init__(self, window=3600, slices=12, min_dwell=1.0, grace_frames=4):
+        self.window = window
+        self.min_dwell = min_dwell # ignore tracks shorter than this, in seconds
+        self.grace_frames = grace_frames # missed frames before a track has left, match the tracker's deregister_frames
+        self.entered = {} # track id -> time the track entered the area
+        self.last_seen = {} # track id -> time the track was last in the area
+        self.missed = {} # track id -> frames missed in a row
+        self.initial = set() # tracks already present at start, their entry time is unknown
+        self.dwell_times = RollingAggregate(window, slices)
+        self.occupancy = RollingAggregate(window, slices)
+        self.arrivals = RollingAggregate(window, slices)
+        self._start_time = None
+
+    def update(self, ids, now=None):
+        """Updates the dwell timers with the track IDs currently in the area.
+        A track that is missing for up to grace_frames frames and then returns
+        keeps its original entry time.
+
+        Args:
+            ids (list): IDs of the tracks in the area this frame
+            now (float): Timestamp of the frame, defaults to the current time
+
+        Returns:
+            list: Dwell times in seconds of the tracks that left the area
+        """
+        now = time.time() if now is None else now
+        first_update = self._start_time is None
+        if first_update:
+            self._start_time = now
+        departed = []
+        for key in list(self.entered):
+            if key in ids:
+                continue
+            self.missed[key] += 1
+            if self.missed[key] > self.grace_frames:
+                # the track left when it was last seen, not when the grace period ran out
+                dwell = self.last_seen.pop(key) - self.entered.pop(key)
+                del self.missed[key]
+                if key in self.initial:
+                    self.initial.discard(key)
+                elif dwell >= self.min_dwell:
+                    self.dwell_times.add(dwell, now)
+                    departed.append(dwell)
+        for key in ids:
+            if key not in self.entered:
+                self.entered[key] = now
+                if first_update:
+                    self.initial.add(key)
+                else:
+                    self.arrivals.add(1, now)
+            self.last_seen[key] = now
+            self.missed[key] = 0
+        self.occupancy.add(len(self.entered), now)
+        return departed
+
+    def arrivals_per_minute(self, now=None):
+        """Arrivals per minute over the part of the window seen so far, and at
+        least one minute so the first frames do not read as a burst.
+        """
+        now = time.time() if now is None else now
+        if self._start_time is None:
+            return 0.0
+        minutes = max(self.arrivals.covered(now, self._start_time), 60) / 60
+        return self.arrivals.snapshot(now).count / minutes
+
+    def summary(self, now=None):
+        now = time.time() if now is None else now
+        dwell = self.dwell_times.snapshot(now)
+        summary = {
+            'window_seconds': self.window,
+            'current_dwell': {key: round(now - entered, 1) for key, entered in self.entered.items()
+                              if key not in self.initial},
+            'completed': dwell.count,
+            'mean_dwell': _round(dwell.mean()),
+            'p50_dwell': _round(dwell.quantile(0.5)),
+            'p90_dwell': _round(dwell.quantile(0.9)),
+            'max_dwell': _round(dwell.max),
+            'arrivals_per_minute': round(self.arrivals_per_minute(now), 2)
+        }
+        occupancy = self.occupancy.snapshot(now)
+        summary['mean_queue_length'] = _round(occupancy.mean())
+        summary['max_queue_length'] = occupancy.max
+        return summary
+
+
+def _round(value, digits=1):
+    if value is None:
+        return None
+    return round(value, digits)